@@ -1,23 +1,40 @@
 import os
 import json
-import pandas as pd
+import time
+import argparse
+from io import BytesIO
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import re
-import pickle
 from dotenv import load_dotenv
 
 import openai
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 
+from specbot_prompts import STATIC_SYSTEM_PROMPT
+
 # ----- ENV and CONFIG -----
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_KEY")
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-SOURCE_FOLDER_ID = os.getenv("SOURCE_FOLDER_ID").replace("'", '').replace('"', '').strip()
+if "SOURCE_FOLDER_ID" not in os.environ:
+    raise RuntimeError("SOURCE_FOLDER_ID is not set; add it to .env")
+SOURCE_FOLDER_ID = os.environ["SOURCE_FOLDER_ID"].translate(str.maketrans('', '', '\'"')).strip()
 OAUTH_CREDENTIALS = os.getenv("GOOGLE_OAUTH_CREDENTIALS", "credentials.json")
+TOKEN_FILE = 'token.json'
 CACHE_FILE = 'gpt_filename_cache.json'
 EXAMPLES_KEY = 'examples'
+GPT_BATCH_SIZE = 20
+GPT_MAX_WORKERS = 8
+GPT_MAX_RPM = int(os.getenv("OPENAI_MAX_RPM", "60"))
+BATCH_POLL_SECONDS = 30
+SHEET_COLUMNS = [
+    "Item Code", "Brand", "Product + Variant", "Dimensions", "No. of Colours",
+    "Filename", "Notes", "View URL"
+]
 
 # ---- OPENAI 1.x CLIENT ----
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
@@ -29,23 +46,22 @@ SCOPES = [
 
 def get_google_creds():
     creds = None
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file(OAUTH_CREDENTIALS, SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+        with open(TOKEN_FILE, 'w', encoding='utf-8') as token:
+            token.write(creds.to_json())
     return creds
 
 def build_google_services():
     creds = get_google_creds()
-    drive_service = build('drive', 'v3', credentials=creds)
-    sheets_service = build('sheets', 'v4', credentials=creds)
+    drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False, static_discovery=True)
+    sheets_service = build('sheets', 'v4', credentials=creds, cache_discovery=False, static_discovery=True)
     return drive_service, sheets_service
 
 def load_cache():
@@ -66,7 +82,10 @@ def list_drive_files(drive_service, folder_id):
         resp = drive_service.files().list(
             q=f"'{folder_id}' in parents and trashed = false",
             fields="nextPageToken, files(id, name)",
-            pageToken=page_token
+            pageSize=1000,
+            pageToken=page_token,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
         ).execute()
         files.extend(resp.get('files', []))
         page_token = resp.get('nextPageToken', None)
@@ -74,42 +93,126 @@ def list_drive_files(drive_service, folder_id):
             break
     return files
 
-def build_gpt_prompt(filename, cache):
+# Appended to the shared static prompt, so every importer request starts with the
+# same cacheable prefix as the app's queries
+GPT_BATCH_INSTRUCTIONS = (
+    "You will be given a numbered list of filenames. "
+    "Return as JSON with one result per filename, in the same order: "
+    "{\"results\": [{\"parsed\": [..fields..], \"notes\": \"...\"}, ...]}. "
+    "Keep each note to one short sentence."
+)
+# Notes prefix of results that never came back from GPT; these are not cached
+GPT_ERROR = "GPT error"
+
+def build_gpt_messages(filenames, cache):
+    # Static instructions first and per-request filenames last, so consecutive
+    # requests share the longest possible prefix for OpenAI's prompt caching
     examples = cache.get(EXAMPLES_KEY, [])[:5]
     examples_txt = "\n".join([
         f"{ex['filename']} -> {ex['parsed']} (Note: {ex['notes']})"
         for ex in examples
     ]) if examples else "No prior examples available."
-    prompt = (
-        "You are a file naming expert for print/packaging specs. "
-        "Given a filename, parse these 5 fields, treating underscores only as delimiters: "
-        "[Item Code, Brand, Product+Variant, Dimensions, No. of Colours].\n"
-        "Product+Variant may contain underscores inside, do not split further. "
-        "Hyphens and numbers can appear anywhere. Always explain edge cases or corrections in notes.\n"
-        "Here are some parsed filenames with notes:\n"
-        f"{examples_txt}\n"
-        f"Now parse: {filename}\n"
-        "Return as JSON: "
-        "{\"parsed\": [..fields..], \"notes\": \"...\"}"
-    )
-    return prompt
+    numbered = "\n".join(f"{i}. {fname}" for i, fname in enumerate(filenames, 1))
+    return [
+        {"role": "system", "content": f"{STATIC_SYSTEM_PROMPT}\n{GPT_BATCH_INSTRUCTIONS}\nHere are some parsed filenames with notes:\n{examples_txt}"},
+        {"role": "user", "content": f"Now parse each of these {len(filenames)} filenames:\n{numbered}"}
+    ]
+
+def build_gpt_request(filenames, cache):
+    # Chat completions request body, shared by the sync path and the Batch API
+    return {
+        "model": "gpt-4o",
+        "messages": build_gpt_messages(filenames, cache),
+        "response_format": {"type": "json_object"},
+        # A single {"parsed": [...], "notes": "..."} result is ~40 tokens
+        "max_tokens": 96 * len(filenames),
+        "temperature": 0
+    }
+
+def unpack_gpt_results(content, filenames):
+    # Map a {"results": [...]} reply back onto filenames by position
+    results = json.loads(content)['results']
+    parsed_results = []
+    for i in range(len(filenames)):
+        item = results[i] if i < len(results) else {}
+        if 'parsed' in item:
+            parsed_results.append((item['parsed'], item.get('notes', '')))
+        else:
+            parsed_results.append((["", "", "", "", ""], f"{GPT_ERROR}: no result returned for this filename"))
+    return parsed_results
+
+def gpt_error_results(filenames, error):
+    return [(["", "", "", "", ""], f"{GPT_ERROR}: {error}") for _ in filenames]
+
+_rate_lock = threading.Lock()
+_next_request_at = [0.0]
 
-def gpt_parse_filename(filename, cache):
-    prompt = build_gpt_prompt(filename, cache)
+def wait_for_rate_limit():
+    # Space request starts at least 60 / GPT_MAX_RPM seconds apart across all threads
+    with _rate_lock:
+        now = time.monotonic()
+        start = max(now, _next_request_at[0])
+        _next_request_at[0] = start + 60.0 / GPT_MAX_RPM
+    time.sleep(start - now)
+
+def gpt_parse_filenames_batch(filenames, cache):
+    # One request for up to GPT_BATCH_SIZE filenames
+    wait_for_rate_limit()
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=256,
-            temperature=0
-        )
-        content = response.choices[0].message.content
-        data = json.loads(content)
-        parsed, notes = data['parsed'], data.get('notes', '')
-        return parsed, notes
+        response = client.chat.completions.create(**build_gpt_request(filenames, cache))
+        return unpack_gpt_results(response.choices[0].message.content, filenames)
     except Exception as e:
         print("GPT parsing error:", e)
-        return ["", "", "", "", ""], f"GPT error: {e}"
+        return gpt_error_results(filenames, e)
+
+def gpt_parse_filenames_batch_api(filenames, cache):
+    # Same chunked requests as the sync path, submitted as one OpenAI Batch API job
+    chunks = [filenames[i:i + GPT_BATCH_SIZE] for i in range(0, len(filenames), GPT_BATCH_SIZE)]
+    # The JSONL is built in memory and uploaded directly; nothing is left on disk
+    lines = [
+        json.dumps({
+            "custom_id": f"chunk-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_gpt_request(chunk, cache)
+        }, ensure_ascii=False)
+        for i, chunk in enumerate(chunks)
+    ]
+    batch_input = BytesIO(("\n".join(lines) + "\n").encode('utf-8'))
+    try:
+        batch_file = client.files.create(file=("batch.jsonl", batch_input), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"Submitted OpenAI batch {batch.id} ({len(filenames)} filenames). Waiting for results...")
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(BATCH_POLL_SECONDS)
+            batch = client.batches.retrieve(batch.id)
+            print(f"Batch {batch.id}: {batch.status}")
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"batch {batch.id} ended with status {batch.status}")
+        output = client.files.content(batch.output_file_id).text
+    except Exception as e:
+        print("GPT batch error:", e)
+        return gpt_error_results(filenames, e)
+
+    by_chunk = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        chunk = chunks[int(record['custom_id'].split('-', 1)[1])]
+        try:
+            content = record['response']['body']['choices'][0]['message']['content']
+            by_chunk[record['custom_id']] = unpack_gpt_results(content, chunk)
+        except Exception as e:
+            by_chunk[record['custom_id']] = gpt_error_results(chunk, e)
+    parsed_results = []
+    for i, chunk in enumerate(chunks):
+        parsed_results.extend(by_chunk.get(f"chunk-{i}") or gpt_error_results(chunk, "no batch output for this request"))
+    return parsed_results
 
 def parse_filename(filename):
     name, _ = os.path.splitext(filename)
@@ -119,9 +222,32 @@ def parse_filename(filename):
     else:
         return None, None
 
-def batch_parse_and_update_cache(files, cache):
+def add_cache_entry(cache, filename, parsed, notes, source, view_url):
+    cache[filename] = {
+        "parsed": parsed,
+        "notes": notes,
+        "source": source,
+        "corrected_by": None,
+        "view_url": view_url
+    }
+    # Add to few-shot examples if high quality
+    if len(parsed) == 5 and all(parsed):
+        cache.setdefault(EXAMPLES_KEY, [])
+        cache[EXAMPLES_KEY].append({
+            "filename": filename,
+            "parsed": parsed,
+            "notes": notes,
+            "source": source,
+            "corrected_by": None,
+            "view_url": view_url
+        })
+        if len(cache[EXAMPLES_KEY]) > 20:
+            cache[EXAMPLES_KEY] = cache[EXAMPLES_KEY][-20:]
+
+def batch_parse_and_update_cache(files, cache, sync=False):
     drive_base = "https://drive.google.com/file/d/"
     updated = False
+    needs_gpt = {}  # filename -> view_url, in Drive listing order
     for file in files:
         filename = file['name']
         file_id = file['id']
@@ -131,36 +257,33 @@ def batch_parse_and_update_cache(files, cache):
             continue  # Skip already cached for parse
         parts, notes = parse_filename(filename)
         if parts:
-            cache[filename] = {
-                "parsed": parts,
-                "notes": notes,
-                "source": "Rule",
-                "corrected_by": None,
-                "view_url": view_url
-            }
+            add_cache_entry(cache, filename, parts, notes, "Rule", view_url)
         else:
-            parsed, gpt_notes = gpt_parse_filename(filename, cache)
-            cache[filename] = {
-                "parsed": parsed,
-                "notes": gpt_notes,
-                "source": "GPT",
-                "corrected_by": None,
-                "view_url": view_url
-            }
-        # Add to few-shot examples if high quality
-        if len(cache[filename]['parsed']) == 5 and all(cache[filename]['parsed']):
-            cache.setdefault(EXAMPLES_KEY, [])
-            cache[EXAMPLES_KEY].append({
-                "filename": filename,
-                "parsed": cache[filename]["parsed"],
-                "notes": cache[filename]["notes"],
-                "source": cache[filename]["source"],
-                "corrected_by": None,
-                "view_url": view_url
-            })
-            if len(cache[EXAMPLES_KEY]) > 20:
-                cache[EXAMPLES_KEY] = cache[EXAMPLES_KEY][-20:]
+            needs_gpt[filename] = view_url
         updated = True
+    # Everything the rules couldn't handle goes to GPT, GPT_BATCH_SIZE filenames per request
+    pending = list(needs_gpt.items())
+    filenames = [filename for filename, _ in pending]
+    if not filenames:
+        return updated
+    if sync:
+        # Requests are network-bound, so keep several in flight; the cache is
+        # only read here and gets updated serially below
+        chunks = [filenames[i:i + GPT_BATCH_SIZE] for i in range(0, len(filenames), GPT_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=GPT_MAX_WORKERS) as executor:
+            chunk_results = executor.map(lambda chunk: gpt_parse_filenames_batch(chunk, cache), chunks)
+            results = [result for chunk_result in chunk_results for result in chunk_result]
+    else:
+        results = gpt_parse_filenames_batch_api(filenames, cache)
+    failed = 0
+    for (filename, view_url), (parsed, gpt_notes) in zip(pending, results):
+        if gpt_notes.startswith(GPT_ERROR):
+            # Left out of the cache so the next run sends it to GPT again
+            failed += 1
+            continue
+        add_cache_entry(cache, filename, parsed, gpt_notes, "GPT", view_url)
+    if failed:
+        print(f"{failed} filenames could not be parsed by GPT; they will be retried on the next run.")
     return updated
 
 def write_to_gsheet(cache, sheets_service, gsheet_id, tab_name="Parsed_Files"):
@@ -172,12 +295,8 @@ def write_to_gsheet(cache, sheets_service, gsheet_id, tab_name="Parsed_Files"):
         notes = entry.get('notes', "")
         view_url = entry.get('view_url', "")
         rows.append(parsed + [fname, notes, view_url])
-    df = pd.DataFrame(rows, columns=[
-        "Item Code", "Brand", "Product + Variant", "Dimensions", "No. of Colours",
-        "Filename", "Notes", "View URL"
-    ])
-    values = [df.columns.tolist()] + df.values.tolist()
-    body = {'values': values}
+    # The rows are already plain lists, so send them as-is
+    body = {'values': [SHEET_COLUMNS] + rows}
     try:
         sheets_service.spreadsheets().batchUpdate(
             spreadsheetId=gsheet_id,
@@ -200,13 +319,19 @@ def write_to_gsheet(cache, sheets_service, gsheet_id, tab_name="Parsed_Files"):
     print("Google Sheet updated.")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parse Drive filenames into the spec cache and sync to Google Sheets.")
+    arg_parser.add_argument(
+        "--sync", action="store_true",
+        help="Parse with direct chat completions instead of the (cheaper, slower) OpenAI Batch API."
+    )
+    args = arg_parser.parse_args()
     print("Authorizing with Google OAuth 2.0...")
     drive_service, sheets_service = build_google_services()
     print("Scanning Google Drive folder for files...")
     files = list_drive_files(drive_service, SOURCE_FOLDER_ID)
     print(f"Found {len(files)} files. Loading cache...")
     cache = load_cache()
-    cache_updated = batch_parse_and_update_cache(files, cache)
+    cache_updated = batch_parse_and_update_cache(files, cache, sync=args.sync)
     if cache_updated:
         print(f"Cache updated. {len(cache) - len(cache.get(EXAMPLES_KEY, []))} files now cached.")
         save_cache(cache)
@@ -0,0 +1,18 @@
+# Dev check, not needed at runtime: OpenAI only caches a prompt prefix of at least
+# PROMPT_CACHE_MIN_TOKENS tokens, so run this after editing specbot_prompts.py.
+# Needs `pip install tiktoken` and network access for its encodings on first use.
+import sys
+
+import tiktoken
+
+from specbot_prompts import PROMPT_CACHE_MIN_TOKENS, STATIC_SYSTEM_PROMPT
+
+MODELS = ("gpt-4o", "gpt-3.5-turbo")
+
+if __name__ == "__main__":
+    short = False
+    for model in MODELS:
+        tokens = len(tiktoken.encoding_for_model(model).encode(STATIC_SYSTEM_PROMPT))
+        print(f"{model}: {tokens} tokens (minimum {PROMPT_CACHE_MIN_TOKENS})")
+        short = short or tokens < PROMPT_CACHE_MIN_TOKENS
+    sys.exit(1 if short else 0)
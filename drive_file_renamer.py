@@ -1,116 +1,318 @@
 import os
-import pickle
-import json
+import mmap
+import orjson
+import time
+import random
+import functools
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import threading
+import concurrent.futures
 from dotenv import load_dotenv
+import httplib2
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
 
 # --- ENV SETUP ---
 load_dotenv()
-SOURCE_FOLDER_ID = os.getenv("SOURCE_FOLDER_ID").replace("'", '').replace('"', '').strip()
+if "SOURCE_FOLDER_ID" not in os.environ:
+    raise RuntimeError("SOURCE_FOLDER_ID is not set; add it to .env")
+# Drops stray quotes that load_dotenv() leaves in place
+SOURCE_FOLDER_ID = os.environ["SOURCE_FOLDER_ID"].translate(str.maketrans('', '', '\'"')).strip()
 OAUTH_CREDENTIALS = os.getenv("GOOGLE_OAUTH_CREDENTIALS", "credentials.json")
+TOKEN_FILE = 'token.json'
 CACHE_FILE = 'gpt_filename_cache.json'
-RENAME_LOG = 'drive_rename_log.json'
+RENAME_LOG = 'drive_rename_log.jsonl'
+# Drive rejects batches above 100 inner requests ("inner batch requests soft limit")
+MAX_BATCH = 100
+RETRYABLE_STATUSES = {403, 429, 500, 503}
+# Minimum gap between Drive dispatches, from the sustained write quota (~3 req/s)
+MIN_INTERVAL = 1.0 / float(os.getenv("DRIVE_WRITE_RPS", "3"))
+_last_dispatch = [0.0]
+_pace_lock = threading.Lock()
+# Batches executing at once while the next page is being listed
+DRIVE_CONCURRENCY = int(os.getenv("DRIVE_CONCURRENCY", "3"))
+_thread_local = threading.local()
+_state_lock = threading.Lock()
+# Optional comma-separated MIME types to list, e.g. "application/pdf,image/png";
+# filtering in the query means Drive never sends files we would skip anyway
+RENAME_MIME_TYPES = [m.strip() for m in os.getenv("RENAME_MIME_TYPES", "").split(",") if m.strip()]
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
 def get_google_creds():
     creds = None
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
+    # Plain JSON with just the token fields; unlike a pickle it can't run code when loaded
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file(OAUTH_CREDENTIALS, SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+        with open(TOKEN_FILE, 'w', encoding='utf-8') as token:
+            token.write(creds.to_json())
     return creds
 
 def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    else:
+    # Parse straight from the page cache via mmap; no intermediate bytes copy of the file
+    if not os.path.exists(CACHE_FILE) or os.path.getsize(CACHE_FILE) == 0:
         return {}
+    with open(CACHE_FILE, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # orjson takes a memoryview but not the mmap itself
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+def _write_cache(cache, option):
+    # The app and batch_importer.py read this file too: write a temp file of our
+    # own and swap it in, so none of them ever sees a half-written cache
+    tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(cache, option=orjson.OPT_NON_STR_KEYS | option))
+    os.replace(tmp_file, CACHE_FILE)
 
 def save_cache(cache):
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, indent=2, ensure_ascii=False)
+    # Compact UTF-8 straight from orjson; use save_cache_pretty() to inspect by hand
+    _write_cache(cache, orjson.OPT_APPEND_NEWLINE)
 
-def save_rename_log(log):
-    with open(RENAME_LOG, 'w', encoding='utf-8') as f:
-        json.dump(log, f, indent=2, ensure_ascii=False)
+def save_cache_pretty(cache):
+    _write_cache(cache, orjson.OPT_INDENT_2)
 
 def get_target_filename(parsed_fields, orig_ext):
     # Compose target filename from 5 parts, preserving extension
-    return '_'.join(parsed_fields) + orig_ext
+    if len(parsed_fields) != 5:
+        return '_'.join(parsed_fields) + orig_ext
+    a, b, c, d, e = parsed_fields
+    return f"{a}_{b}_{c}_{d}_{e}{orig_ext}"
+
+def _list_query(folder_id):
+    q = f"'{folder_id}' in parents and trashed = false"
+    if RENAME_MIME_TYPES:
+        q += " and (" + " or ".join(f"mimeType = '{m}'" for m in RENAME_MIME_TYPES) + ")"
+    return q
+
+def _is_retryable(error):
+    # 429/5xx are always transient; a 403 only when it is a rate-limit or quota error
+    if not isinstance(error, HttpError) or error.resp.status not in RETRYABLE_STATUSES:
+        return False
+    if error.resp.status != 403:
+        return True
+    details = f"{error.error_details} {error.content!r}".lower()
+    return 'ratelimit' in details or 'quota' in details
+
+def _with_backoff(fn, *args, max_attempts=5, base=1.0, cap=32.0, **kwargs):
+    # Retry throttled calls with full-jitter exponential backoff
+    for attempt in range(max_attempts):
+        try:
+            return fn(*args, **kwargs)
+        except HttpError as e:
+            if not _is_retryable(e) or attempt == max_attempts - 1:
+                raise
+            time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+
+def _pace():
+    # Sleep just long enough to keep dispatches MIN_INTERVAL apart, across all threads
+    with _pace_lock:
+        dt = time.monotonic() - _last_dispatch[0]
+        if dt < MIN_INTERVAL:
+            time.sleep(MIN_INTERVAL - dt)
+        _last_dispatch[0] = time.monotonic()
+
+def _paced_execute(request, http=None):
+    # Works for both a single API request and a BatchHttpRequest
+    _pace()
+    return request.execute(http=http)
+
+def _thread_http(creds):
+    # httplib2.Http is not thread-safe, so every worker thread gets its own transport
+    if not hasattr(_thread_local, 'http'):
+        _thread_local.http = AuthorizedHttp(creds, http=httplib2.Http())
+    return _thread_local.http
+
+def _on_rename_done(run, entry, file_id, curr_name, tgt_name, request_id, response, exception):
+    # BatchHttpRequest callback; the first five arguments are bound with functools.partial.
+    # Runs on worker threads, so all shared run state is touched under _state_lock.
+    with _state_lock:
+        if exception is not None:
+            if _is_retryable(exception):
+                run["retry_queue"].append((entry, file_id, curr_name, tgt_name))
+            else:
+                logger.warning("rename failed %s -> %s: %s", curr_name, tgt_name, exception)
+            return
+        # One line per rename as it happens, so a crash mid-run keeps the log so far
+        run["log_fp"].write(orjson.dumps({
+            "file_id": file_id,
+            "old_name": curr_name,
+            "new_name": tgt_name
+        }).decode() + "\n")
+        run["renamed"] += 1
+        # Lets the next run skip this file without recomputing its target name
+        entry["renamed_to"] = tgt_name
+        # Optional: update cache, so it can always be accessed by latest name
+        cache = run["cache"]
+        if curr_name in cache and tgt_name not in cache:
+            cache[tgt_name] = cache.pop(curr_name)
 
-def batch_rename_drive_files(drive_service, folder_id, cache):
+def _add_rename(drive_service, batch, run, entry, file_id, curr_name, tgt_name):
+    batch.add(
+        drive_service.files().update(fileId=file_id, body={"name": tgt_name}, supportsAllDrives=True),
+        callback=functools.partial(_on_rename_done, run, entry, file_id, curr_name, tgt_name),
+        request_id=file_id
+    )
+
+def _execute_batch(batch, creds, slots):
+    try:
+        _with_backoff(_paced_execute, batch, http=_thread_http(creds))
+    finally:
+        slots.release()
+
+def _flush(drive_service, batch, executor, slots, futures, creds):
+    # Hand the batch to a worker and return an empty one; blocks while
+    # DRIVE_CONCURRENCY batches are already in flight
+    slots.acquire()
+    futures.append(executor.submit(_execute_batch, batch, creds, slots))
+    return drive_service.new_batch_http_request()
+
+def _drain(futures):
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            future.result()
+        except Exception:
+            # Out of retries or not retryable; the other batches keep going and their
+            # renames are still saved. Files in this batch are picked up on the next run.
+            logger.exception("rename batch failed")
+    futures.clear()
+
+def _retry_throttled(drive_service, run, executor, slots, futures, creds, max_attempts=5, base=1.0, cap=32.0):
+    # Individual updates inside a batch can be throttled even when the batch call succeeds
+    retry_queue = run["retry_queue"]
+    for attempt in range(max_attempts):
+        if not retry_queue:
+            return
+        time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+        retries = list(retry_queue)
+        retry_queue.clear()
+        for i in range(0, len(retries), MAX_BATCH):
+            batch = drive_service.new_batch_http_request()
+            for entry, file_id, curr_name, tgt_name in retries[i:i + MAX_BATCH]:
+                _add_rename(drive_service, batch, run, entry, file_id, curr_name, tgt_name)
+            _flush(drive_service, batch, executor, slots, futures, creds)
+        _drain(futures)
+    for entry, file_id, curr_name, tgt_name in retry_queue:
+        logger.warning("rename failed after %d retries %s -> %s", max_attempts, curr_name, tgt_name)
+
+def batch_rename_drive_files(drive_service, folder_id, cache, creds):
     page_token = None
-    renamed = 0
     skipped = 0
-    # We'll store all rename operations here
-    rename_log = []
-    # Create quick lookup for cache by both old and new name
-    cache_by_old = {k: v for k, v in cache.items() if k not in ['examples', 'rename_log']}
-    cache_by_new = {}
-
-    for k, v in cache_by_old.items():
-        parsed = v.get('parsed', [""]*5)
+    # One lookup keyed by both the cached (old) name and the target name, both
+    # pointing at the same (entry, target stem, extension, target name) tuple.
+    # An old name always wins over another entry's target name.
+    lookup = {}
+    for k, v in cache.items():
+        if k in ('examples', 'rename_log'):
+            continue
+        stem = get_target_filename(v.get('parsed', [""]*5), "")
         ext = os.path.splitext(k)[1]
-        tgt_name = get_target_filename(parsed, ext)
-        cache_by_new[tgt_name] = v
-
-    while True:
-        resp = drive_service.files().list(
-            q=f"'{folder_id}' in parents and trashed = false",
-            fields="nextPageToken, files(id, name)",
-            pageToken=page_token
-        ).execute()
-        for f in resp.get('files', []):
-            curr_name = f['name']
-            file_id = f['id']
-            ext = os.path.splitext(curr_name)[1]
-            # Try to find record by current or intended name
-            cache_entry = cache_by_old.get(curr_name) or cache_by_new.get(curr_name)
-            if cache_entry:
-                parsed = cache_entry.get('parsed', [""]*5)
-                tgt_name = get_target_filename(parsed, ext)
-                if curr_name != tgt_name:
-                    print(f"Renaming in Drive: {curr_name} -> {tgt_name}")
-                    drive_service.files().update(fileId=file_id, body={"name": tgt_name}).execute()
-                    rename_log.append({
-                        "file_id": file_id,
-                        "old_name": curr_name,
-                        "new_name": tgt_name
-                    })
-                    # Optional: update cache, so it can always be accessed by latest name
-                    if curr_name in cache and tgt_name not in cache:
-                        cache[tgt_name] = cache.pop(curr_name)
-                    renamed += 1
-                else:
-                    skipped += 1
-            else:
-                print(f"Skipping (not in cache): {curr_name}")
-                skipped += 1
-        page_token = resp.get('nextPageToken', None)
-        if page_token is None:
-            break
-    print(f"Renamed {renamed} files. Skipped {skipped} files.")
-    # Save rename log in a separate file and in cache for easy reference
-    cache["rename_log"] = rename_log
-    save_cache(cache)
-    save_rename_log(rename_log)
+        match = (v, stem, ext, stem + ext)
+        lookup[k] = match
+        lookup.setdefault(match[3], match)
+
+    # Legacy caches carried the whole rename log; it now lives only in RENAME_LOG
+    dropped_log = cache.pop("rename_log", None) is not None
+
+    # Renames go out as batch requests, many per HTTP round-trip. Full batches
+    # run on worker threads while this thread keeps listing the next page.
+    futures = []
+    slots = threading.BoundedSemaphore(DRIVE_CONCURRENCY)
+    # Renames that come back throttled go on retry_queue and are sent again after the main pass
+    run = {"cache": cache, "retry_queue": [], "renamed": 0}
+    try:
+        with open(RENAME_LOG, 'a', encoding='utf-8', buffering=1) as log_fp, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=DRIVE_CONCURRENCY) as executor:
+            run["log_fp"] = log_fp
+            batch = drive_service.new_batch_http_request()
+            pending = 0
+            while True:
+                resp = _with_backoff(_paced_execute, drive_service.files().list(
+                    q=_list_query(folder_id),
+                    fields="nextPageToken, files(id,name)",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True
+                ))
+                for f in resp.get('files', []):
+                    curr_name = f['name']
+                    file_id = f['id']
+                    # Try to find record by current or intended name
+                    match = lookup.get(curr_name)
+                    if match:
+                        cache_entry, stem, ext, tgt_name = match
+                        if cache_entry.get("renamed_to") == curr_name:
+                            skipped += 1
+                            continue
+                        # The Drive file keeps its own extension; only split the name
+                        # when it doesn't end with the one cached for the entry
+                        if not ext or not curr_name.endswith(ext):
+                            tgt_name = stem + os.path.splitext(curr_name)[1]
+                        if curr_name != tgt_name:
+                            logger.info("rename %s -> %s", curr_name, tgt_name)
+                            _add_rename(drive_service, batch, run, cache_entry, file_id, curr_name, tgt_name)
+                            pending += 1
+                            if pending >= MAX_BATCH:
+                                batch = _flush(drive_service, batch, executor, slots, futures, creds)
+                                pending = 0
+                        else:
+                            skipped += 1
+                    else:
+                        logger.info("skip (not in cache) %s", curr_name)
+                        skipped += 1
+                page_token = resp.get('nextPageToken', None)
+                if page_token is None:
+                    break
+            if pending:
+                _flush(drive_service, batch, executor, slots, futures, creds)
+            _drain(futures)
+            _retry_throttled(drive_service, run, executor, slots, futures, creds)
+    finally:
+        # Whatever already succeeded in Drive is written back, even if the run is cut short;
+        # a run that renamed nothing leaves the file alone
+        logger.info("Renamed %d files. Skipped %d files.", run['renamed'], skipped)
+        if run['renamed'] or dropped_log:
+            save_cache(cache)
+
+def start_logging():
+    # Callers (including batch worker threads) only enqueue records; a single
+    # listener thread does the actual writes to stderr
+    log_queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, handler)
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    listener.start()
+    return listener
 
 if __name__ == "__main__":
-    print("Authorizing with Google OAuth 2.0...")
-    creds = get_google_creds()
-    drive_service = build('drive', 'v3', credentials=creds)
-    print(f"Renaming files in Google Drive folder {SOURCE_FOLDER_ID}...")
-    cache = load_cache()
-    batch_rename_drive_files(drive_service, SOURCE_FOLDER_ID, cache)
-    print("Drive renaming complete. All operations logged in drive_rename_log.json.")
+    log_listener = start_logging()
+    try:
+        logger.info("Authorizing with Google OAuth 2.0...")
+        creds = get_google_creds()
+        # Use the discovery document bundled with the client: no HTTP fetch or disk cache per start
+        drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False, static_discovery=True)
+        logger.info("Renaming files in Google Drive folder %s...", SOURCE_FOLDER_ID)
+        cache = load_cache()
+        batch_rename_drive_files(drive_service, SOURCE_FOLDER_ID, cache, creds)
+        logger.info("Drive renaming complete. All operations logged in %s.", RENAME_LOG)
+    finally:
+        log_listener.stop()
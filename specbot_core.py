@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import orjson
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import openai
+import streamlit as st
+
+from specbot_prompts import STATIC_SYSTEM_PROMPT
+
+# Cache I/O, query parsing and GPT helpers shared by the Streamlit app(s)
+
+# --- Load secrets directly from Streamlit ---
+OPENAI_API_KEY = st.secrets["OPENAI_KEY"]
+CACHE_FILE = 'gpt_filename_cache.json'
+PARQUET_FILE = 'gpt_filename_cache.parquet'
+EXAMPLES_KEY = 'examples'
+QUERY_CACHE_FILE = 'query_cache.json'
+
+FIELDNAMES = [
+    "Item Code",
+    "Brand",
+    "Product + Variant",
+    "Dimensions",
+    "No. of Colours",
+]
+# Lowercased copies of the searchable columns plus the parsed colour count,
+# built once per cache load
+SEARCH_COLS = ["_brand_lc", "_product_lc", "_dim_lc", "_col_int"]
+BRAND_TERMS = ("dettol", "germol", "godrej")
+PRODUCT_TERMS = ("cool",)
+_DIM_RE = re.compile(r"(\d+)[xX](\d+)")
+_COL_RE = re.compile(r"(\d+)col")
+_ABOVE_RE = re.compile(r"above\s+(\d+)")
+_WHITESPACE_RE = re.compile(r"\s+")
+ARTWORK_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg')
+# Guards the shared query-answer cache; Streamlit runs each session on its own thread
+_query_cache_lock = threading.Lock()
+# Serializes cache saves from different sessions
+_cache_lock = threading.Lock()
+
+@st.cache_resource
+def get_openai_client():
+    return openai.OpenAI(api_key=OPENAI_API_KEY)
+
+def _cache_mtime():
+    # Cache key for the memoized loaders: any write to the file invalidates them
+    return os.path.getmtime(CACHE_FILE) if os.path.exists(CACHE_FILE) else 0.0
+
+@st.cache_data(ttl=3600)
+def _load_cache_cached(mtime):
+    if os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    return {EXAMPLES_KEY: []}
+
+def load_cache():
+    return _load_cache_cached(_cache_mtime())
+
+def get_session_cache():
+    # One parsed copy per browser session, reloaded only when the file changes on disk
+    mtime = _cache_mtime()
+    if "cache" not in st.session_state or st.session_state.get("cache_mtime") != mtime:
+        st.session_state.cache = load_cache()
+        st.session_state.cache_mtime = mtime
+    return st.session_state.cache
+
+def save_cache(cache):
+    # Write to a temp file of our own and swap it in, so a crash or a concurrent
+    # writer (another session, drive_file_renamer.py) never leaves a half-written cache
+    with _cache_lock:
+        tmp_file = f"{CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(cache, option=orjson.OPT_INDENT_2))
+        # os.replace keeps the mtime, so this is the cache file's mtime for exactly this content
+        mtime = os.path.getmtime(tmp_file)
+        os.replace(tmp_file, CACHE_FILE)
+        _refresh_parquet(cache, mtime)
+    _load_cache_cached.clear()
+    _load_cache_df_cached.clear()
+    st.session_state.cache = cache
+    st.session_state.cache_mtime = _cache_mtime()
+
+def _build_cache_df(cache):
+    # Fill one list per column so pandas doesn't have to transpose rows
+    columns = {name: [] for name in FIELDNAMES + ["Filename", "Notes", "View URL"]}
+    field_columns = [columns[name] for name in FIELDNAMES]
+    fnames, notes_list, urls = columns["Filename"], columns["Notes"], columns["View URL"]
+    for fname, entry in cache.items():
+        if fname == EXAMPLES_KEY:
+            continue
+        parsed = entry.get('parsed', [""]*5)
+        for i, column in enumerate(field_columns):
+            column.append(parsed[i] if i < len(parsed) else "")
+        fnames.append(fname)
+        notes_list.append(entry.get('notes', ""))
+        urls.append(entry.get('view_url', ""))
+    df = pd.DataFrame(columns)
+    # Hand edits or GPT output can leave non-string values; Parquet needs one type per column
+    text_cols = list(columns)
+    df[text_cols] = df[text_cols].fillna("").astype(str)
+    df["_brand_lc"] = df["Brand"].str.lower().fillna("")
+    df["_product_lc"] = df["Product + Variant"].str.lower().fillna("")
+    df["_dim_lc"] = df["Dimensions"].str.lower().fillna("")
+    df["_col_int"] = df["No. of Colours"].astype(str).str.extract(r"(\d+)", expand=False).astype("Int64")
+    return df
+
+def _refresh_parquet(cache, mtime):
+    # The snapshot records the mtime of the JSON it was built from, so it is only
+    # used while the cache file is still exactly that version. Each writer uses its
+    # own temp file and swaps it in, so readers and concurrent rebuilds never see a
+    # partial snapshot.
+    df = _build_cache_df(cache)
+    tmp_file = f"{PARQUET_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"source_mtime"] = repr(mtime).encode()
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_file)
+        os.replace(tmp_file, PARQUET_FILE)
+    except Exception:
+        # The snapshot only speeds up the next load; keep serving the JSON-built frame
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return df
+
+def _parquet_source_mtime():
+    try:
+        metadata = pq.read_schema(PARQUET_FILE).metadata or {}
+        return float(metadata[b"source_mtime"])
+    except (OSError, KeyError, ValueError, pa.ArrowException):
+        # Missing, unreadable, or written before the mtime was recorded
+        return None
+
+@st.cache_data(ttl=3600)
+def _load_cache_df_cached(mtime):
+    if _parquet_source_mtime() == mtime:
+        return pd.read_parquet(PARQUET_FILE)
+    # The JSON was changed elsewhere (e.g. by batch_importer.py): rebuild once
+    return _refresh_parquet(_load_cache_cached(mtime), mtime)
+
+def load_cache_df():
+    return _load_cache_df_cached(_cache_mtime())
+
+def _parse_query(q):
+    # Pull every filter the (lowercased) query asks for out in one go
+    dim_match = _DIM_RE.search(q)
+    col_match = _COL_RE.search(q) if "col" in q else None
+    above_match = _ABOVE_RE.search(q) if "above" in q and "col" in q else None
+    return {
+        "brands": {b for b in BRAND_TERMS if b in q},
+        "product_terms": [t for t in PRODUCT_TERMS if t in q],
+        "dim": f"{dim_match.group(1)}x{dim_match.group(2)}" if dim_match else None,
+        "col_eq": int(col_match.group(1)) if col_match else None,
+        "col_gt": int(above_match.group(1)) if above_match else None,
+    }
+
+def simple_query_df(df, user_query):
+    filters = _parse_query(user_query.lower())
+    brands, product_terms, dim = filters["brands"], filters["product_terms"], filters["dim"]
+    col_eq, col_gt = filters["col_eq"], filters["col_gt"]
+    if brands or product_terms or dim or col_eq is not None or col_gt is not None:
+        # One pass over the rows instead of one column scan per filter
+        def match(row):
+            brand, product, dims, cols = row
+            if cols is pd.NA and (col_eq is not None or col_gt is not None):
+                return False
+            return (
+                all(b in brand for b in brands)
+                and all(t in product for t in product_terms)
+                and (dim is None or dim in dims)
+                and (col_eq is None or cols == col_eq)
+                and (col_gt is None or cols > col_gt)
+            )
+        rows = zip(df["_brand_lc"], df["_product_lc"], df["_dim_lc"], df["_col_int"])
+        mask = np.fromiter((match(row) for row in rows), dtype=bool, count=len(df))
+        df = df[mask]
+    return df.drop(columns=SEARCH_COLS)
+
+def parse_filename(filename):
+    # Only a bare artwork filename qualifies; anything else (a question, a missing or
+    # extra trailing field) goes to GPT. Product+Variant keeps its own underscores.
+    name, ext = os.path.splitext(filename)
+    if ext.lower() not in ARTWORK_EXTENSIONS or len(filename.split()) != 1 or name.count('_') < 4:
+        return None, None
+    item_code, brand, rest = name.split('_', 2)
+    product, dims, cols = rest.rsplit('_', 2)
+    if not _COL_RE.fullmatch(cols.lower()):
+        return None, None
+    return [item_code, brand, product, dims, cols], "Standard 5-part parse (Product+Variant combined)."
+
+def gpt_query(user_query, cache):
+    # A pasted filename needs no model: answer in the same JSON shape GPT would
+    parts, notes = parse_filename(user_query.strip())
+    if parts:
+        return json.dumps({"parsed": parts, "notes": notes}, ensure_ascii=False)
+    # Learned examples change between runs, so they go after the static prefix
+    learned_examples = "\n".join([
+        f"{ex['filename']} => {ex['parsed']} (Note: {ex['notes']})"
+        for ex in cache.get(EXAMPLES_KEY, [])[:2]
+    ])
+    system_msg = STATIC_SYSTEM_PROMPT
+    if learned_examples:
+        system_msg += f"\nMore examples from this project:\n{learned_examples}"
+    client = get_openai_client()
+    try:
+        resp = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": user_query}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=96,
+            temperature=0
+        )
+        return resp.choices[0].message.content
+    except Exception as e:
+        # Fallback to gpt-3.5-turbo
+        try:
+            resp = client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_msg},
+                    {"role": "user", "content": user_query}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=96,
+                temperature=0
+            )
+            return resp.choices[0].message.content
+        except Exception as ee:
+            return f"OpenAI API Error: {e}\nFallback Error: {ee}"
+
+@st.cache_resource
+def load_query_cache():
+    # One dict per server process, shared by every rerun and session
+    if os.path.exists(QUERY_CACHE_FILE):
+        with open(QUERY_CACHE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    return {}
+
+def _query_cache_keys(user_query):
+    # Exact key on the normalized text, plus a looser key that ignores word order
+    normalized = _WHITESPACE_RE.sub(" ", user_query.lower().strip())
+    tokens = " ".join(sorted(normalized.split(" ")))
+    return normalized, "tokens:" + hashlib.sha1(tokens.encode("utf-8")).hexdigest()
+
+def get_cached_answer(user_query):
+    query_cache = load_query_cache()
+    exact_key, tokens_key = _query_cache_keys(user_query)
+    with _query_cache_lock:
+        return query_cache.get(exact_key) or query_cache.get(tokens_key)
+
+def save_cached_answer(user_query, answer):
+    query_cache = load_query_cache()
+    with _query_cache_lock:
+        for key in _query_cache_keys(user_query):
+            query_cache[key] = answer
+        # Same temp file + swap as save_cache, so a crash never leaves a truncated file
+        tmp_file = QUERY_CACHE_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(query_cache, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_file, QUERY_CACHE_FILE)
@@ -0,0 +1,199 @@
+# Static GPT prompt shared by the app and batch_importer.py. Kept free of
+# streamlit so the importer and check_prompt_tokens.py can import it.
+
+# Canonical parses that never change. Together with the field guide they form a
+# byte-identical system prompt prefix, which OpenAI's automatic prompt caching only
+# reuses across calls once it is at least PROMPT_CACHE_MIN_TOKENS long
+# (check with `python check_prompt_tokens.py`).
+PROMPT_CACHE_MIN_TOKENS = 1024
+STATIC_EXAMPLES = [
+    {
+        "filename": "3103159_Dettol_Soap_Cool_Menthol_96X135MM_9COL.pdf",
+        "parsed": [
+            "3103159", "Dettol", "Soap_Cool_Menthol", "96X135MM", "9COL"
+        ],
+        "notes": "Standard Dettol soap spec. Product+Variant combined: Soap_Cool_Menthol."
+    },
+    {
+        "filename": "ITM-GER-004_Germol_Soap_Lemon_174X95MM_5COL.png",
+        "parsed": [
+            "ITM-GER-004", "Germol", "Soap_Lemon", "174X95MM", "5COL"
+        ],
+        "notes": "Non-numeric code example. Product+Variant is Soap_Lemon."
+    },
+    {
+        "filename": "20042586_Godrej_Soap_LimeAloeVera_126X169MM_8COL.pdf",
+        "parsed": [
+            "20042586", "Godrej", "Soap_LimeAloeVera", "126X169MM", "8COL"
+        ],
+        "notes": "Godrej LimeAloeVera, 8 colors. Product+Variant combined: Soap_LimeAloeVera."
+    },
+    {
+        "filename": "20051234_Godrej_No1_Soap_Sandal_Turmeric_110X150MM_7COL.pdf",
+        "parsed": [
+            "20051234", "Godrej", "No1_Soap_Sandal_Turmeric", "110X150MM", "7COL"
+        ],
+        "notes": "Long Product+Variant with several underscores; only the first four underscores delimit."
+    },
+    {
+        "filename": "3109876-A_Dettol_Soap_Skincare_Pack-of-4_220X140MM_10COL.jpg",
+        "parsed": [
+            "3109876-A", "Dettol", "Soap_Skincare_Pack-of-4", "220X140MM", "10COL"
+        ],
+        "notes": "Item code with a revision suffix; hyphens stay inside their field. Two-digit colour count."
+    },
+    {
+        "filename": "ITM-GER-010_Germol_Talc_Classic_85x160mm_5col.png",
+        "parsed": [
+            "ITM-GER-010", "Germol", "Talc_Classic", "85x160mm", "5col"
+        ],
+        "notes": "Lowercase dimensions and colours are kept exactly as written."
+    },
+    {
+        "filename": "3104521_Dettol_Handwash_Original_Refill_750ML_90X210MM_6COL.pdf",
+        "parsed": [
+            "3104521", "Dettol", "Handwash_Original_Refill_750ML", "90X210MM", "6COL"
+        ],
+        "notes": "Pack size 750ML belongs to Product+Variant, not Dimensions."
+    },
+    {
+        "filename": "ITM-GOD-021_Godrej_Cinthol_Lime_Soap_125G_Pack-of-3_180X120MM_9COL.png",
+        "parsed": [
+            "ITM-GOD-021", "Godrej", "Cinthol_Lime_Soap_125G_Pack-of-3", "180X120MM", "9COL"
+        ],
+        "notes": "Sub-brand Cinthol stays inside Product+Variant; Brand is the second field as written."
+    },
+    {
+        "filename": "0045871_Germol_Soap_Neem_100X60MM_4COL.jpeg",
+        "parsed": [
+            "0045871", "Germol", "Soap_Neem", "100X60MM", "4COL"
+        ],
+        "notes": "Leading zeros in the item code are kept."
+    },
+    {
+        "filename": "3102200_Dettol_Soap_Original_96X135MM.pdf",
+        "parsed": [
+            "3102200", "Dettol", "Soap_Original", "96X135MM", ""
+        ],
+        "notes": "Colour count missing from the filename; left empty for manual review."
+    },
+    {
+        "filename": "20047710_Godrej_Soap_Aloe_Vera_Combo_126X169MM_8COL_FINAL.pdf",
+        "parsed": [
+            "20047710", "Godrej", "Soap_Aloe_Vera_Combo", "126X169MM", "8COL"
+        ],
+        "notes": "Trailing _FINAL after the colour count is not a field; dropped and flagged here."
+    },
+    {
+        "filename": "3107788_Dettol_Liquid_Handwash_Lime_Pump_200ML_60X180MM_7COL.pdf",
+        "parsed": [
+            "3107788", "Dettol", "Liquid_Handwash_Lime_Pump_200ML", "60X180MM", "7COL"
+        ],
+        "notes": "Container type (Pump) and volume stay inside Product+Variant."
+    },
+    {
+        "filename": "ITM-GER-017_Germol_Antiseptic_Liquid_Label_Front_120X80MM_4COL.pdf",
+        "parsed": [
+            "ITM-GER-017", "Germol", "Antiseptic_Liquid_Label_Front", "120X80MM", "4COL"
+        ],
+        "notes": "Label position (Front) is part of Product+Variant."
+    },
+    {
+        "filename": "ITM-GER-018_Germol_Antiseptic_Liquid_Label_Back_120X80MM_2COL.pdf",
+        "parsed": [
+            "ITM-GER-018", "Germol", "Antiseptic_Liquid_Label_Back", "120X80MM", "2COL"
+        ],
+        "notes": "Back label of the same product; a different item code and colour count are normal."
+    },
+    {
+        "filename": "20063321_Godrej_Protekt_Handwash_Refill_Pouch_185ML_140X200MM_6COL.png",
+        "parsed": [
+            "20063321", "Godrej", "Protekt_Handwash_Refill_Pouch_185ML", "140X200MM", "6COL"
+        ],
+        "notes": "Sub-brand Protekt and pack format Refill_Pouch are all Product+Variant."
+    },
+    {
+        "filename": "3105502_Dettol_Soap_Cool_Carton_12X75G_310X205MM_5COL.pdf",
+        "parsed": [
+            "3105502", "Dettol", "Soap_Cool_Carton_12X75G", "310X205MM", "5COL"
+        ],
+        "notes": "12X75G is a pack count, not a dimension: it has no MM unit and sits before the real Dimensions."
+    },
+    {
+        "filename": "20049901_Godrej_No1_Soap_Jasmine_Wrapper_98.5X140MM_8COL.pdf",
+        "parsed": [
+            "20049901", "Godrej", "No1_Soap_Jasmine_Wrapper", "98.5X140MM", "8COL"
+        ],
+        "notes": "Decimal dimensions are kept exactly as written."
+    },
+    {
+        "filename": "ITM-GOD-033_Godrej_Ezee_Liquid_Detergent_1L_Bottle_95X250MM_9COL.jpg",
+        "parsed": [
+            "ITM-GOD-033", "Godrej", "Ezee_Liquid_Detergent_1L_Bottle", "95X250MM", "9COL"
+        ],
+        "notes": "Volume 1L belongs to Product+Variant."
+    },
+    {
+        "filename": "3101010_Dettol_Soap_Original_Promo_Buy3Get1_180X140MM_10COL.pdf",
+        "parsed": [
+            "3101010", "Dettol", "Soap_Original_Promo_Buy3Get1", "180X140MM", "10COL"
+        ],
+        "notes": "Promotional text (Buy3Get1) is part of Product+Variant."
+    },
+    {
+        "filename": "0098123_Germol_Soap_Herbal_75X55X30MM_3COL.png",
+        "parsed": [
+            "0098123", "Germol", "Soap_Herbal", "75X55X30MM", "3COL"
+        ],
+        "notes": "Three-part dimensions (width X height X depth) are one Dimensions field."
+    },
+    {
+        "filename": "20055012_Godrej_Cinthol_Deo_Soap_Sport_100G_96X135MM_1COL.pdf",
+        "parsed": [
+            "20055012", "Godrej", "Cinthol_Deo_Soap_Sport_100G", "96X135MM", "1COL"
+        ],
+        "notes": "Single-colour artwork is still written with the COL suffix."
+    },
+    {
+        "filename": "3108801_Dettol_Soap_Cool_96X135MM_9COL_v2.pdf",
+        "parsed": [
+            "3108801", "Dettol", "Soap_Cool", "96X135MM", "9COL"
+        ],
+        "notes": "A version tag after the colour count (_v2) is not a field; dropped and flagged here."
+    },
+    {
+        "filename": "ITM-DET-050_Dettol_Surface_Cleaner_Citrus_500ML_Spray_Label_150X110MM_6COL.jpeg",
+        "parsed": [
+            "ITM-DET-050", "Dettol", "Surface_Cleaner_Citrus_500ML_Spray_Label", "150X110MM", "6COL"
+        ],
+        "notes": "Very long Product+Variant: everything between Brand and Dimensions."
+    },
+]
+
+STATIC_SYSTEM_PROMPT = (
+    "You are a filename parser for packaging spec files. "
+    "Every filename is always in the format: "
+    "ItemCode_Brand_Product+Variant_Dimensions_NoOfColours.ext — always 5 parts, underscores as delimiters. "
+    "Product+Variant may have internal underscores. Do NOT split Product+Variant further. "
+    "Given a new filename, split it into the 5 parts as shown. "
+    "For a single filename, return JSON: {\"parsed\": [...], \"notes\": \"...\"}\n"
+    "Field guide:\n"
+    "- Item Code: the text before the first underscore. Numeric codes (3103159), ITM-style codes "
+    "(ITM-GER-004) and codes with revision suffixes (3109876-A) are all valid. Never drop leading zeros.\n"
+    "- Brand: the text between the first and second underscore, exactly as written (Dettol, Germol, Godrej, ...).\n"
+    "- Product+Variant: everything between the Brand and the Dimensions. It can contain any number of "
+    "underscores, hyphens, digits and pack sizes such as 125G or 750ML.\n"
+    "- Dimensions: width X height with a unit, e.g. 96X135MM. Keep the original case and unit.\n"
+    "- No. of Colours: the colour count with its COL suffix, e.g. 9COL, at the end of the name.\n"
+    "- The extension (.pdf, .png, .jpg, .jpeg) is not one of the 5 fields.\n"
+    "Pack counts and sizes (12X75G, 125G, 750ML, 1L) are never Dimensions: Dimensions always carry a length unit "
+    "such as MM and are the second-last field. Label positions (Front, Back), pack formats (Carton, Wrapper, Pouch, "
+    "Bottle) and promotional text all stay in Product+Variant.\n"
+    "If a filename does not fit the pattern (missing dimensions or colour count, extra text after the colours), "
+    "still return 5 fields, leave the missing ones as empty strings and explain the problem in notes.\n"
+    "Here are examples:\n"
+    + "\n".join(
+        f"{ex['filename']} => {ex['parsed']} (Note: {ex['notes']})"
+        for ex in STATIC_EXAMPLES
+    )
+)